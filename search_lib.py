@@ -0,0 +1,471 @@
+"""
+Shared library of the IP Fabric configuration search scripts: downloads the configuration files through IP Fabric's API,
+searches the specific input strings in them and outputs the compliance result.
+
+2022-08 - Version 2.0
+using ipfabric SDK
+WARNING: you should make sure the SDK version matches your version of IP Fabric
+
+"""
+
+# Built-in/Generic Imports
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+from dateutil.tz import tzlocal
+from dotenv import load_dotenv
+from ipfabric import IPFClient
+from ipfabric.tools import DeviceConfigs
+from ipfabric.tools.configuration import Config
+
+try:
+    from rich import print
+except ImportError:
+    None
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# rich styles every print, so the download progress dots bypass it when the output is not a terminal
+if sys.stdout.isatty():
+    progressTick = functools.partial(print, ".", end="")
+else:
+    progressTick = functools.partial(sys.stdout.write, ".")
+
+# Get Current Path
+CURRENT_PATH = Path(os.path.realpath(os.path.dirname(sys.argv[0]))).resolve()
+# testing only: CURRENT_PATH = Path(os.path.realpath(os.path.curdir)).resolve()
+# Load environment variables
+load_dotenv(os.path.join(CURRENT_PATH, ".env"), override=True)
+
+# Setting static parameters
+IPF_TOKEN = os.getenv("IPF_TOKEN", "f1b0f57a2921b127d7d481740437cd39")
+IPF_URL = os.getenv("IPF_URL", "https://ipfabric.local/")
+# If IPF_VERIFY is False, the request will accept any TLS certificate presented by the server
+IPF_VERIFY = (os.getenv("IPF_VERIFY", "False")=="True")
+# Whether to download only sanitized configuration files (files without passwords)
+SANITIZED = (os.getenv("IPF_SANITIZED_CONFIG", "False")=="True")
+# Other static parameters
+SNAPSHOT_ID = os.getenv("IPF_SNAPSHOT", "$last")
+# Number of configuration files downloaded in parallel
+DL_WORKERS = int(os.getenv("IPF_DL_WORKERS", "16"))
+# Number of processes used to search through the configuration files
+SEARCH_PROCESSES = int(os.getenv("IPF_SEARCH_PROCESSES", os.cpu_count() or 1))
+# Local cache of the configuration files, keyed by their hash
+CACHE_PATH = CURRENT_PATH / ".cache" / "configs"
+# Number of configuration files kept in the cache per device, 0 disables the cache
+CACHE_KEEP = int(os.getenv("IPF_CACHE_KEEP", "3"))
+# Format of the output file: feather, parquet or csv (feather and parquet require pyarrow)
+OUTPUT_FORMAT = os.getenv("IPF_OUTPUT_FORMAT", "feather")
+OUTPUT_FORMATS = {"feather": "Feather", "parquet": "Parquet", "csv": "CSV"}
+# Number of devices whose configuration metadata is requested at once
+CONFIG_CHUNK = 100
+
+# A top-level section is a non-indented header line followed by its indented lines,
+# it ends at the first line which does not start with a space or a tab (blank lines included).
+# Every repetition has to consume a newline followed by an indent, so the engine never backtracks.
+# Possessive quantifiers (re supports them since Python 3.11) also skip saving the backtracking states.
+if sys.version_info >= (3, 11):
+    SECTION_REGEX = re.compile(r"(?m)^(\S[^\n]*+)(?:\n[ \t][^\n]*+)*+")
+else:
+    SECTION_REGEX = re.compile(r"(?m)^(\S[^\n]*)(?:\n[ \t][^\n]*)*")
+
+
+def createConfigDict(config_list):
+    """A function to return object of only last config files out of list of configuration files.
+    config_list : list of objects
+    """
+    print("\n  GENERATING configuration item objects")
+    last_confs = {}
+    for conf in config_list:
+        last_confs.setdefault(conf["hostname"], conf)
+    # convert all the timestamps at once, in local time like time.ctime()
+    last_changes = (
+        pd.to_datetime([conf["lastChangeAt"] for conf in last_confs.values()], unit="ms", utc=True)
+        .tz_convert(tzlocal())
+        .strftime("%a %b %d %H:%M:%S %Y")
+    )
+    return {
+        hostname: {
+            "hash": conf["hash"],
+            "hostname": hostname,
+            "lastChangeAt": last_change,
+        }
+        for (hostname, conf), last_change in zip(last_confs.items(), last_changes)
+    }
+
+
+def latestConfigs(configs, serial_numbers: list):
+    """A function to return the latest configuration of the requested devices, indexed by serial number.
+    The metadata (hash, lastChangeAt, ...) of the configurations is fetched in bulk, CONFIG_CHUNK devices per request.
+    configs : DeviceConfigs object
+    serial_numbers : list of serial numbers of the devices
+    """
+    latest = {}
+    for start in range(0, len(serial_numbers), CONFIG_CHUNK):
+        chunk = serial_numbers[start : start + CONFIG_CHUNK]
+        res = configs.ipf.fetch_all(
+            "tables/management/configuration",
+            sort={"order": "desc", "column": "lastChangeAt"},
+            columns=["id", "sn", "hostname", "lastChangeAt", "lastCheckAt", "status", "hash"],
+            filters={"or": [{"sn": ["eq", sn]} for sn in chunk]},
+            snapshot=False,
+        )
+        # configurations are sorted by lastChangeAt, newest first
+        for cfg in res:
+            latest.setdefault(cfg["sn"], Config(**cfg))
+    return latest
+
+
+def loadConfigText(configs, dev_config):
+    """A function to fill in the text of a configuration, it is read from the local cache when available.
+    configs : DeviceConfigs object
+    dev_config : Config object, latest configuration of the device
+    """
+    if CACHE_KEEP < 1:
+        return configs.get_text_config(dev_config)
+
+    text_file = CACHE_PATH / f"{dev_config.config_hash}.txt"
+    if text_file.is_file():
+        dev_config.text = text_file.read_bytes().decode()
+    else:
+        configs.get_text_config(dev_config)
+        # write to a temporary file first, so an interrupted run never leaves a truncated config
+        tmp_file = text_file.with_name(f"{text_file.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            tmp_file.write_bytes(dev_config.text.encode())
+            os.replace(tmp_file, text_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+    # sidecar file listing the cached configurations of the device, newest first. It is named after a hash
+    # of the serial number: unique per device, filesystem safe and insensitive to case-folding filesystems
+    host_file = CACHE_PATH / (hashlib.sha1(dev_config.sn.encode()).hexdigest() + ".json")
+    history = json.loads(host_file.read_text()) if host_file.is_file() else []
+    history = [
+        {"hash": dev_config.config_hash, "lastChangeAt": dev_config.last_change.isoformat()},
+        *(entry for entry in history if entry["hash"] != dev_config.config_hash),
+    ]
+    host_file.write_text(json.dumps(history[:CACHE_KEEP], indent=2))
+    return dev_config
+
+
+def evictConfigCache(started: float):
+    """A function to remove the cached configuration files which are no longer kept for any device.
+    started : time at which the run started, files written since then (possibly by another run) are kept
+    """
+    if CACHE_KEEP < 1 or not CACHE_PATH.is_dir():
+        return
+    kept = set()
+    for host_file in CACHE_PATH.glob("*.json"):
+        kept.update(entry["hash"] for entry in json.loads(host_file.read_text()))
+    for text_file in CACHE_PATH.glob("*.txt"):
+        if text_file.stem in kept:
+            continue
+        try:
+            if text_file.stat().st_mtime < started:
+                text_file.unlink()
+        except FileNotFoundError:
+            # already evicted by another run
+            pass
+
+
+def downloadConfig(configs, input_devices: list):
+    """A generator yielding the latest configuration files as soon as they are downloaded.
+    configs : DeviceConfigs object
+    input_devices : list of objects, with the hostname and the serial number (sn) of the devices
+    """
+    print("\n  DOWNLOADING latest configuration files:")
+    started = time.time()
+    if CACHE_KEEP > 0:
+        CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    latest_configs = latestConfigs(configs, [device["sn"] for device in input_devices])
+    # Get the text of the latest configs, the API calls are independent so run them in parallel
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DL_WORKERS) as executor:
+        futures = []
+        for device in input_devices:
+            if dev_config := latest_configs.get(device["sn"]):
+                futures.append(executor.submit(loadConfigText, configs, dev_config))
+            else:
+                print(f"##WARNING## conf not found for '{device['hostname']}'")
+        for future in concurrent.futures.as_completed(futures):
+            dev_config = future.result()
+            progressTick()
+            yield {
+                "hash": dev_config.config_hash,
+                "hostname": dev_config.hostname,
+                "lastChangeAt": dev_config.last_change,
+                "text": dev_config.text,
+            }
+    evictConfigCache(started)
+
+
+@functools.lru_cache(maxsize=None)
+def literalMatcher(literals):
+    """A function returning a callable which gives the set of literals found in a text.
+    If hyperscan or pyahocorasick is installed, all the literals are searched in a single pass over the text.
+    literals : tuple of strings
+    """
+    # nothing to search for, neither a hyperscan database nor an automaton can be built empty
+    if not literals:
+        return lambda text: set()
+    if not all(literals) or (hyperscan is None and ahocorasick is None):
+        # encode the literals once, each text is encoded once and searched with bytes.find
+        patterns = [(literal, literal.encode()) for literal in literals]
+
+        def find(text):
+            buffer = text.encode()
+            return {literal for literal, pattern in patterns if buffer.find(pattern) != -1}
+
+        return find
+    if hyperscan is None:
+        automaton = ahocorasick.Automaton()
+        for literal in literals:
+            automaton.add_word(literal, literal)
+        automaton.make_automaton()
+        return lambda text: {literal for _, literal in automaton.iter(text)}
+    database = hyperscan.Database()
+    database.compile(
+        expressions=[literal.encode() for literal in literals],
+        ids=list(range(len(literals))),
+        elements=len(literals),
+        flags=hyperscan.HS_FLAG_SINGLEMATCH,
+        literal=True,
+    )
+
+    def match(text):
+        found = set()
+        database.scan(
+            text.encode(),
+            match_event_handler=lambda pattern_id, start, end, flags, context: found.add(
+                literals[pattern_id]
+            ),
+        )
+        return found
+
+    return match
+
+
+def scanConfig(conf, input_strings):
+    """A function to search for a specific list of string within a single configuration file.
+    Attributes:
+    ----------
+    conf: object
+        object item containing the hostname and the config file
+    input_strings: list of strings
+        the list of strings to search for
+    """
+    # one result per input string, the size is known upfront
+    result = [None] * len(input_strings)
+    # search all the literals without section at once
+    literals = tuple(dict.fromkeys(it["match"] for it in input_strings if "section" not in it))
+    found = literalMatcher(literals)(conf["text"])
+    # index every top-level section once: header line -> section text
+    sections = {}
+    for block in SECTION_REGEX.finditer(conf["text"]):
+        sections.setdefault(block[1], block[0])
+    # look up each requested section once: first section whose header starts with the requested section
+    section_texts = {}
+    for name in dict.fromkeys(it["section"] for it in input_strings if "section" in it):
+        section_texts[name] = next((text for header, text in sections.items() if header.startswith(name)), None)
+    # identical (section, match) inputs are only searched once
+    section_matches = {}
+    for index, input_string in enumerate(input_strings):
+        if "section" in input_string:
+            key = (input_string["section"], input_string["match"])
+            if key not in section_matches:
+                section = section_texts[input_string["section"]]
+                section_matches[key] = section is not None and input_string["match"] in section
+            present_in_conf = "YES" if section_matches[key] else "NO"
+        elif input_string["match"] in found:
+            present_in_conf = "YES"
+        else:
+            present_in_conf = "NO"
+        # build the result in one go, input_strings is left untouched
+        result[index] = {**input_string, "hostname": conf["hostname"], "configured": present_in_conf}
+    return result
+
+
+def searchConfig(input_strings, config_list, config_count: Optional[int] = None):
+    """A generator yielding the search result of a specific list of string within the configuration files.
+    Attributes:
+    ----------
+    input_strings: list of strings
+        the list of strings to search for
+    config_list: iterable of objects
+        object items containing hostnames, config files, ..
+    config_count: int, optional
+        number of configuration files in config_list when known, caps the number of processes
+    """
+    print("\n  SEARCHING configuration files:")
+    # identical configuration files (same hash) are searched once, their result is shared by all their hosts
+    hosts_by_hash = {}
+    unique_hashes = []
+    # config_list is consumed by the pool's task handler thread, an exception raised there would be sent
+    # to a worker through the task queue (and hang imap if it cannot be unpickled), so it is re-raised here
+    download_errors = []
+
+    def uniqueConfigs():
+        try:
+            for conf in config_list:
+                hosts = hosts_by_hash.setdefault(conf["hash"], [])
+                hosts.append(conf["hostname"])
+                if len(hosts) == 1:
+                    unique_hashes.append(conf["hash"])
+                    yield conf
+        except Exception as error:
+            download_errors.append(error)
+
+    # scanning is pure CPU work and independent per configuration file,
+    # configuration files are handed to the workers as soon as they are available
+    processes = SEARCH_PROCESSES if config_count is None else min(SEARCH_PROCESSES, config_count)
+    pool = multiprocessing.Pool(processes=processes) if processes > 1 else None
+    with pool or contextlib.nullcontext():
+        scan = functools.partial(scanConfig, input_strings=input_strings)
+        searched = {}
+        # results come back in the order of unique_hashes
+        for index, conf_result in enumerate((pool.imap if pool else map)(scan, uniqueConfigs())):
+            conf_hash = unique_hashes[index]
+            hosts = hosts_by_hash[conf_hash][:]
+            searched[conf_hash] = (conf_result, len(hosts))
+            yield from ({**item, "hostname": host} for host in hosts for item in conf_result)
+    if download_errors:
+        raise download_errors[0]
+    # hosts received after their configuration file had already been searched
+    for conf_hash, (conf_result, shared) in searched.items():
+        hosts = hosts_by_hash[conf_hash][shared:]
+        yield from ({**item, "hostname": host} for host in hosts for item in conf_result)
+
+
+def create_output(data_frame: pd.DataFrame, filename: Optional[str] = None, fmt: str = "feather"):
+    """
+    Function to create the output file (feather, parquet or csv) based on the Dataframe
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{fmt}', expected one of {list(OUTPUT_FORMATS)}")
+    # Check if hostname has been specify when calling the function
+    if filename is None or filename == "":
+        output_filename = f"{time.strftime('%Y%m%d%H%M%S')}.{fmt}"
+    else:
+        output_filename = f"{time.strftime('%Y%m%d%H%M%S')}-{filename}.{fmt}"
+    if fmt == "feather":
+        data_frame.to_feather(output_filename, compression="lz4")
+    elif fmt == "parquet":
+        data_frame.to_parquet(output_filename, compression="snappy", index=False)
+    else:
+        # Large write buffer, and no newline translation as the rows are written with '\n'
+        with open(output_filename, "w", newline="", buffering=1 << 20) as csv_file:
+            data_frame.to_csv(csv_file, index=False, lineterminator="\n")
+
+    if os.path.isfile(output_filename):
+        print(f"##INFO## {OUTPUT_FORMATS[fmt]} file has been created: '{os.path.realpath(output_filename)}'")
+
+
+def format_list_df(data_list: List):
+    """
+    Change a list of dictionnaries with the host info, to a Dataframe.
+    'None' and '' values are stored as missing values, columns without any value are skipped
+    """
+    data_list = [{key: value if value != "" else None for key, value in item.items()} for item in data_list]
+    columns = list(dict.fromkeys(key for item in data_list for key, value in item.items() if value is not None))
+    # Move 'hostname' as the 1st column
+    if "hostname" in columns:
+        columns.insert(0, columns.pop(columns.index("hostname")))
+    data_frame = pd.DataFrame(data_list, columns=columns)
+    # Low cardinality columns, repeated for every device
+    for column in ("ref", "section", "match", "configured"):
+        if column in data_frame:
+            data_frame[column] = data_frame[column].astype("category")
+    return data_frame
+
+
+def searchDevices(input_strings, devices_filter=None):
+    """A function returning a generator of the search results of input_strings within the configuration files of the devices.
+    Attributes:
+    ----------
+    input_strings: list of strings
+        the list of strings to search for
+    devices_filter: object
+        IP Fabric inventory filter selecting the devices
+    """
+    ipf_client = IPFClient(
+        base_url=IPF_URL,
+        token=IPF_TOKEN,
+        snapshot_id=SNAPSHOT_ID,
+        verify=IPF_VERIFY,
+    )
+
+    configs = DeviceConfigs(ipf_client)
+    # Download configuration files for specific devices, identified by their serial number
+    input_devices = ipf_client.inventory.devices.all(columns=["hostname", "sn"], filters=devices_filter)
+    config_list = downloadConfig(configs, input_devices)
+
+    # Search for specific strings in the configuration files, while they are being downloaded
+    return searchConfig(input_strings, config_list, len(input_devices))
+
+
+def print_compliance(result):
+    """
+    Function to print the compliant and the non compliant checks
+    """
+    result_ok = []
+    result_nok = []
+    for check in result:
+        if check["configured"] == "YES":
+            result_ok.append(check)
+        else:
+            result_nok.append(check)
+    print("\n------------- COMPLIANCE OK -------------")
+    print(result_ok)
+    print("\n!!!!!!!!!!!!! COMPLIANCE NOK !!!!!!!!!!!!!")
+    print(result_nok)
+
+
+def main(input_data, devices_filter=None, default_command="compliance-print"):
+    """Command line entry point of the scripts, the subcommand selects how the result is output.
+    input_data : list of objects, the commands to search for in the configuration
+    devices_filter : IP Fabric inventory filter selecting the devices
+    default_command : subcommand used when none is given on the command line
+    """
+    parser = argparse.ArgumentParser(description="Search strings in the configuration files of IP Fabric")
+    parser.set_defaults(format=OUTPUT_FORMAT, filename="config_compliance")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("compliance-print", help="print the compliant and the non compliant checks")
+    output_parser = subparsers.add_parser("compliance-csv", help="write the checks to a file")
+    output_parser.add_argument(
+        "--format", choices=list(OUTPUT_FORMATS), default=OUTPUT_FORMAT, help="output format (IPF_OUTPUT_FORMAT)"
+    )
+    output_parser.add_argument(
+        "--filename", default="config_compliance", help="suffix of the output file name, after the timestamp"
+    )
+    args = parser.parse_args()
+    command = args.command or default_command
+    # argparse does not check the default (IPF_OUTPUT_FORMAT) against the choices,
+    # reject it before anything is downloaded
+    if command == "compliance-csv" and args.format not in OUTPUT_FORMATS:
+        parser.error(f"unsupported IPF_OUTPUT_FORMAT '{args.format}', expected one of {list(OUTPUT_FORMATS)}")
+
+    result = searchDevices(input_data, devices_filter)
+    if command == "compliance-csv":
+        create_output(format_list_df(result), args.filename, args.format)
+    else:
+        print_compliance(result)